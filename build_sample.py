@@ -0,0 +1,33 @@
+# Build the pre-processed sample file used by dashboard_final.py.
+# Run this once (python build_sample.py) whenever citi_bike_2022_small_sample.csv changes.
+import numpy as np
+import pandas as pd
+
+INPUT_FILE = 'citi_bike_2022_small_sample.csv'
+OUTPUT_FILE = 'citi_bike_2022_small_sample.parquet'
+
+season_order = ['Winter', 'Spring', 'Summer', 'Fall']
+
+# Season code (position in season_order) for each month, indexed directly by month number.
+# Index 0 is unused because months start at 1.
+season_codes = np.array([0, 0, 0, 1, 1, 1, 2, 2, 2, 3, 3, 3, 0], dtype=np.int8)
+
+# Only read the columns the dashboard uses; the pyarrow engine parses them multi-threaded.
+# Station names are stored as a categorical so grouping by station works on integer codes.
+df = pd.read_csv(
+    INPUT_FILE,
+    usecols=['started_at', 'start_station_name'],
+    parse_dates=['started_at'],
+    dtype={'start_station_name': 'category'},
+    engine='pyarrow'
+)
+# normalize() keeps 'date' as datetime64 instead of building a Python date object per row.
+df['date'] = df['started_at'].dt.normalize()
+df['month'] = df['started_at'].dt.month
+
+# Build season straight from its int8 codes, so no per-row string lookup is needed and the
+# column is stored as a small dictionary-encoded column in Parquet.
+df['season'] = pd.Categorical.from_codes(season_codes[df['month'].to_numpy()], categories=season_order)
+
+df.to_parquet(OUTPUT_FILE, engine='pyarrow', compression='zstd', index=False)
+print(f"File saved as '{OUTPUT_FILE}' with {len(df):,} rows.")
@@ -1,7 +1,11 @@
 # Import necessary libraries
+import os
 import streamlit as st
 import pandas as pd
+import polars as pl
 import plotly.graph_objects as go
+import plotly.io as pio
+from plotly.offline import get_plotlyjs_version
 from plotly.subplots import make_subplots
 
 # --- Page Configuration ---
@@ -12,16 +16,48 @@ st.set_page_config(
 )
 
 # --- Data Loading (from pre-aggregated files for speed) ---
+# Each dataset is cached on its own, so it can be invalidated or evicted independently.
 @st.cache_data
-def load_data():
-    df_top_1000 = pd.read_csv('citi_bike_top_1000_routes.csv')
-    df_top_20_stations = df_top_1000.groupby('start_station_name')['trip_count'].sum().nlargest(20).reset_index()
-    df_daily = pd.read_csv('citi_bike_daily_summary_2022.csv')
-    df_daily['date'] = pd.to_datetime(df_daily['date'])
-    df_daily = df_daily.set_index('date') # Set date as index
-    return df_top_20_stations, df_daily
+def load_top20_stations():
+    # Polars parses the CSV multi-threaded; only the 20-row result is converted to pandas.
+    df_top_1000 = pl.read_csv(
+        'citi_bike_top_1000_routes.csv',
+        columns=['start_station_name', 'trip_count'],
+        schema_overrides={'trip_count': pl.Int64}
+    )
+    return (
+        df_top_1000.group_by('start_station_name')
+        .agg(pl.col('trip_count').sum())
+        .top_k(20, by='trip_count')
+        .sort('trip_count', descending=True)
+        .to_pandas()
+    )
 
-df_top_20_stations, df_daily = load_data()
+@st.cache_data
+def load_daily():
+    # Arrow-backed columns; 'date' stays a regular column so it can be handed to Plotly as an
+    # int64-nanosecond datetime64 array rather than through a DatetimeIndex.
+    return pd.read_csv('citi_bike_daily_summary_2022.csv', parse_dates=['date'], dtype_backend='pyarrow')
+
+df_top_20_stations = load_top20_stations()
+df_daily = load_daily()
+
+# --- Figure Rendering ---
+# Static figures are serialized to JSON once and drawn by Plotly.js inside an iframe, so
+# reruns do not send them through st.plotly_chart's validation and encoding again.
+def render_figure_json(fig_json, height):
+    st.iframe(
+        f"""
+        <style>body {{ margin: 0; }}</style>
+        <script src="https://cdn.plot.ly/plotly-{get_plotlyjs_version()}.min.js"></script>
+        <div id="chart" style="height: {height}px;"></div>
+        <script>
+            const fig = {fig_json};
+            Plotly.newPlot('chart', fig.data, fig.layout, {{responsive: true}});
+        </script>
+        """,
+        height=height + 20
+    )
 
 
 # --- Dashboard Title and Introduction ---
@@ -34,73 +70,90 @@ The analysis focuses on station popularity and seasonal demand trends throughout
 # --- Visualization 1: Top 20 Popular Stations ---
 st.header("1. What are the most popular starting stations?")
 
-fig_bar = go.Figure(
-    go.Bar(
-        x=df_top_20_stations['trip_count'],
-        y=df_top_20_stations['start_station_name'],
-        orientation='h',
-        marker=dict(color=df_top_20_stations['trip_count'], colorscale='Viridis')
+# The figure is built once and reused on later reruns.
+@st.cache_resource
+def build_top20_bar(df_top_20_stations):
+    fig_bar = go.Figure(
+        go.Bar(
+            x=df_top_20_stations['trip_count'],
+            y=df_top_20_stations['start_station_name'],
+            orientation='h',
+            marker=dict(color=df_top_20_stations['trip_count'], colorscale='Viridis')
+        )
     )
-)
-# THEME FIX: Explicitly set the template to 'plotly_dark' for consistency.
-fig_bar.update_layout(
-    title=dict(
-        text='Top 20 Most Popular Citi Bike Start Stations (2022)',
-        x=0.5,
-        xanchor='center'
-    ),
-    xaxis_title='Total Number of Trips', yaxis_title='Start Station Name',
-    yaxis=dict(autorange="reversed"),
-    height=700, template='plotly_dark'
-)
-st.plotly_chart(fig_bar, use_container_width=True)
+    # THEME FIX: Explicitly set the template to 'plotly_dark' for consistency.
+    fig_bar.update_layout(
+        title=dict(
+            text='Top 20 Most Popular Citi Bike Start Stations (2022)',
+            x=0.5,
+            xanchor='center'
+        ),
+        xaxis_title='Total Number of Trips', yaxis_title='Start Station Name',
+        yaxis=dict(autorange="reversed"),
+        height=700, template='plotly_dark'
+    )
+    return fig_bar
+
+@st.cache_resource
+def build_top20_bar_json(df_top_20_stations):
+    return pio.to_json(build_top20_bar(df_top_20_stations), validate=False)
+
+render_figure_json(build_top20_bar_json(df_top_20_stations), height=700)
 
 
 # --- Visualization 2: Seasonal Trends ---
 st.header("2. How does ridership change with temperature?")
 st.markdown("A strong positive correlation is visible between the average temperature and the number of daily bike trips. Ridership peaks during the warmest summer months and drops significantly in winter.")
 
-# Use the fully corrected code for the line chart
-fig_line = make_subplots(specs=[[{"secondary_y": True}]])
-fig_line.add_trace(
-    go.Scatter(x=df_daily.index, y=df_daily['trip_count'], name='Daily Bike Trips', mode='lines', line=dict(color='deepskyblue')),
-    secondary_y=False,
-)
-fig_line.add_trace(
-    go.Scatter(x=df_daily.index, y=df_daily['avgTemp'], name='Avg. Temp (°C)', mode='lines', line=dict(color='tomato')),
-    secondary_y=True,
-)
-# THEME FIX & AXIS FIX
-fig_line.update_layout(
-    title=dict(
-        text='Daily Bike Trips vs. Average Temperature in NYC (2022)',
-        x=0.5,
-        xanchor='center'
-    ),
-    template='plotly_dark', height=600,
-    legend=dict(x=0.02, y=0.98),
-    xaxis=dict(type='date', title='Date')
-)
-fig_line.update_yaxes(title_text='Daily Bike Trips', secondary_y=False)
-fig_line.update_yaxes(title_text='Average Temperature (°C)', secondary_y=True)
-fig_line.update_xaxes(range=['2022-01-01', '2022-12-31'])
-st.plotly_chart(fig_line, use_container_width=True)
+# The figure is built once and reused on later reruns.
+@st.cache_resource
+def build_daily_line(df_daily):
+    # Use the fully corrected code for the line chart
+    fig_line = make_subplots(specs=[[{"secondary_y": True}]])
+    fig_line.add_trace(
+        go.Scattergl(x=df_daily['date'].to_numpy(), y=df_daily['trip_count'].to_numpy(), name='Daily Bike Trips', mode='lines', line=dict(color='deepskyblue')),
+        secondary_y=False,
+    )
+    fig_line.add_trace(
+        go.Scattergl(x=df_daily['date'].to_numpy(), y=df_daily['avgTemp'].to_numpy(), name='Avg. Temp (°C)', mode='lines', line=dict(color='tomato')),
+        secondary_y=True,
+    )
+    # THEME FIX & AXIS FIX
+    fig_line.update_layout(
+        title=dict(
+            text='Daily Bike Trips vs. Average Temperature in NYC (2022)',
+            x=0.5,
+            xanchor='center'
+        ),
+        template='plotly_dark', height=600,
+        legend=dict(x=0.02, y=0.98),
+        xaxis=dict(type='date', title='Date')
+    )
+    fig_line.update_yaxes(title_text='Daily Bike Trips', secondary_y=False)
+    fig_line.update_yaxes(title_text='Average Temperature (°C)', secondary_y=True)
+    fig_line.update_xaxes(range=['2022-01-01', '2022-12-31'])
+    return fig_line
+
+@st.cache_resource
+def build_daily_line_json(df_daily):
+    return pio.to_json(build_daily_line(df_daily), validate=False)
+
+render_figure_json(build_daily_line_json(df_daily), height=600)
 
 
 # --- Visualization 3: Geospatial Map of Popular Routes ---
 st.header("3. What are the most popular trip routes?")
 st.markdown("The map below visualizes the top 1,000 most popular bike routes in 2022. Use the filter to narrow down the view to see the absolute busiest 'bike highways' of New York City.")
 
-try:
-    with open('nyc_top_1000_bike_routes.html', 'r') as f:
-        html_data = f.read()
-
+# The map is served as a static file (see enableStaticServing in .streamlit/config.toml) and
+# embedded by URL, so the browser can cache it instead of receiving the HTML on every rerun.
+if os.path.exists('static/nyc_top_1000_bike_routes.html'):
     # THE FIX: Create three columns. The middle one will be very wide.
     # We are giving a little more space on the left to see if it helps centering.
     col1, col2, col3 = st.columns([0.1, 0.8, 0.1]) # 10% left, 80% middle, 10% right
 
     with col2: # Place the map in the wide, central column (col2)
-        st.components.v1.html(html_data, height=1000)
+        st.iframe('/app/static/nyc_top_1000_bike_routes.html', height=1000)
 
-except FileNotFoundError:
-    st.error("Map file ('nyc_top_1000_bike_routes.html') not found. Please ensure it is in the same directory as the script.")
\ No newline at end of file
+else:
+    st.error("Map file ('static/nyc_top_1000_bike_routes.html') not found. Please ensure it is in the 'static' folder next to the script.")
\ No newline at end of file
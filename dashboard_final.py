@@ -1,10 +1,14 @@
 # Import necessary libraries
 import streamlit as st
+import duckdb
+import numpy as np
 import pandas as pd
+import plotly.express as px
 import plotly.graph_objects as go
+import plotly.io as pio
+from plotly.offline import get_plotlyjs_version
 from plotly.subplots import make_subplots
-from PIL import Image
-from numerize.numerize import numerize
+import pydeck as pdk
 
 # --- Page Configuration ---
 st.set_page_config(
@@ -13,33 +17,185 @@ st.set_page_config(
 )
 
 # --- Data Loading ---
-# We use the st.cache_data decorator to load the data only once, making the app faster.
+# load_daily() and station_season_pivot() use st.cache_data, so they only run once.
+# load_sample() is deliberately not cached: the trip-level sample is the largest object and is
+# only read while building the cached station x season table, so it can be freed afterwards.
+def load_sample():
+    # Load the pre-processed sample built by build_sample.py. 'season' and 'start_station_name'
+    # are already categoricals, so there is nothing left to derive here, and only these two
+    # columns are read because the station x season table is all they are used for.
+    return pd.read_parquet(
+        'citi_bike_2022_small_sample.parquet',
+        columns=['season', 'start_station_name']
+    )
+
+# We also still need our pre-calculated daily summary for the line chart
 @st.cache_data
-def load_data():
-    # Load the smaller random sample file we created. This is our primary data source.
-    df = pd.read_csv('citi_bike_2022_small_sample.csv')
-    df['started_at'] = pd.to_datetime(df['started_at'])
-    df['date'] = df['started_at'].dt.date
-    df['month'] = df['started_at'].dt.month
-    
-    # Create the season column based on the month
-    seasons = {
-        12: 'Winter', 1: 'Winter', 2: 'Winter',
-        3: 'Spring', 4: 'Spring', 5: 'Spring',
-        6: 'Summer', 7: 'Summer', 8: 'Summer',
-        9: 'Fall', 10: 'Fall', 11: 'Fall'
-    }
-    df['season'] = df['month'].map(seasons)
-    
-    # We also still need our pre-calculated daily summary for the line chart
-    df_daily = pd.read_csv('citi_bike_daily_summary_2022.csv')
-    df_daily['date'] = pd.to_datetime(df_daily['date'])
-    df_daily = df_daily.set_index('date')
-    
-    # Return both dataframes
-    return df, df_daily
+def load_daily():
+    # Arrow-backed columns; 'date' stays a regular column so it can be handed to Plotly as an
+    # int64-nanosecond datetime64 array rather than through a DatetimeIndex.
+    return pd.read_csv('citi_bike_daily_summary_2022.csv', parse_dates=['date'], dtype_backend='pyarrow')
+
+# Count the sampled trips per (station, season) once. The sidebar filter on page 2 then only
+# has to select columns of this small table instead of scanning every sampled trip.
+@st.cache_data
+def station_season_pivot():
+    df = load_sample()
+    return df.groupby(['start_station_name', 'season'], observed=True, sort=False).size().unstack(fill_value=0)
+
+# Aggregate the route arcs in DuckDB and keep only the k busiest, so the browser only
+# receives the arcs it actually draws. Round trips that start and end at the same station
+# would be zero-length (invisible) arcs, so they are left out.
+@st.cache_data
+def load_top_routes(k):
+    query = """
+        SELECT
+            start_station_name, end_station_name,
+            start_lat, start_lng, end_lat, end_lng,
+            CAST(SUM(trip_count) AS BIGINT) AS trip_count
+        FROM read_csv_auto('citi_bike_top_1000_routes.csv')
+        WHERE start_station_name <> end_station_name
+        GROUP BY ALL
+        ORDER BY trip_count DESC
+        LIMIT ?
+    """
+    with duckdb.connect() as con:
+        return con.execute(query, [k]).df()
+
+df_daily = load_daily()
+df_pivot = station_season_pivot()
+
+# Decode each page image once and reuse the in-memory bitmap on later reruns.
+# PIL is only imported the first time an image is needed.
+@st.cache_resource
+def load_image(path):
+    from PIL import Image
+    return Image.open(path).convert('RGB')
+
+# Short KPI labels such as 149.4K or 1.25M.
+def format_count(n: int) -> str:
+    if n >= 1_000_000:
+        return f'{n / 1_000_000:.2f}M'
+    if n >= 1_000:
+        return f'{n / 1_000:.1f}K'
+    return str(n)
+
+# --- Figure Builders ---
+# Figures are built once per input and reused on later reruns instead of being rebuilt on
+# every widget change.
+season_options = ['Winter', 'Spring', 'Summer', 'Fall']
+
+@st.cache_data(show_spinner=False)
+def build_stacked_bar(seasons_key: frozenset):
+    # Keyed on a frozenset, so there are at most 15 distinct selections and each one is built once.
+    df_pivot_filtered = df_pivot[[season for season in season_options if season in seasons_key]]
+    total_rides = int(df_pivot_filtered.to_numpy().sum())
+
+    # --- Dynamic Calculation for Stacked Bar Chart ---
+    # argpartition selects the 20 busiest stations in O(N) without sorting every station.
+    # With 20 or fewer stations (e.g. a smaller rebuilt sample) all of them are kept.
+    station_totals = df_pivot_filtered.sum(axis=1).to_numpy()
+    k = min(20, len(station_totals))
+    if len(station_totals) > k:
+        top_20_idx = np.argpartition(station_totals, -k)[-k:]
+    else:
+        top_20_idx = np.arange(len(station_totals))
+    top_20_idx = top_20_idx[np.argsort(-station_totals[top_20_idx])]
+    df_stacked_data = (
+        df_pivot_filtered.iloc[top_20_idx]
+        .reset_index()
+        .melt(id_vars='start_station_name', var_name='season', value_name='trip_count')
+    )
+
+    # --- Create the Stacked Bar Chart with Plotly ---
+    # A single px.bar call splits the long-form data by season, instead of adding one trace per season by hand.
+    fig_stacked_bar = px.bar(
+        df_stacked_data,
+        x='trip_count',
+        y='start_station_name',
+        color='season',
+        orientation='h',
+        category_orders={'season': season_options},
+        color_discrete_map={
+            'Winter': 'deepskyblue',
+            'Spring': 'mediumseagreen',
+            'Summer': 'gold',
+            'Fall': 'tomato'
+        }
+    )
+
+    # Update the layout for a professional look
+    fig_stacked_bar.update_layout(
+        title=dict(text='Seasonal Trip Distribution for Top 20 Stations', x=0.5, xanchor='center'),
+        xaxis_title='Number of Trips (from sample)',
+        yaxis_title='Start Station Name',
+        yaxis=dict(categoryorder='total ascending'),
+        barmode='stack',
+        height=800,
+        legend_title_text='Season'
+    )
+
+    return fig_stacked_bar, total_rides
+
+@st.cache_resource
+def build_daily_line(df_daily):
+    # Create the Plotly dual-axis figure (this is the same code from your prototyping notebook)
+    fig_line = make_subplots(specs=[[{"secondary_y": True}]])
+
+    # Add Bike Trips Trace
+    fig_line.add_trace(
+        go.Scattergl(x=df_daily['date'].to_numpy(), y=df_daily['trip_count'].to_numpy(), name='Daily Bike Trips', mode='lines', line=dict(color='deepskyblue')),
+        secondary_y=False,
+    )
+
+    # Add Temperature Trace
+    fig_line.add_trace(
+        go.Scattergl(x=df_daily['date'].to_numpy(), y=df_daily['avgTemp'].to_numpy(), name='Avg. Temp (°C)', mode='lines', line=dict(color='tomato')),
+        secondary_y=True,
+    )
+
+    # Update Layout
+    fig_line.update_layout(
+        title=dict(
+            text='Daily Bike Trips vs. Average Temperature in NYC (2022)',
+            x=0.5,
+            xanchor='center'
+        ),
+        template='plotly_dark', 
+        height=600,
+        legend=dict(x=0.02, y=0.98),
+        xaxis=dict(type='date', title='Date')
+    )
+
+    # Update Y-Axes Titles
+    fig_line.update_yaxes(title_text='Daily Bike Trips', secondary_y=False)
+    fig_line.update_yaxes(title_text='Average Temperature (°C)', secondary_y=True)
+
+    # Set the X-Axis Range
+    fig_line.update_xaxes(range=['2022-01-01', '2022-12-31'])
 
-df, df_daily = load_data()
+    return fig_line
+
+@st.cache_resource
+def build_daily_line_json(df_daily):
+    return pio.to_json(build_daily_line(df_daily), validate=False)
+
+# --- Figure Rendering ---
+# Static figures are serialized to JSON once and drawn by Plotly.js inside an iframe, so
+# reruns do not send them through st.plotly_chart's validation and encoding again.
+def render_figure_json(fig_json, height):
+    st.iframe(
+        f"""
+        <style>body {{ margin: 0; }}</style>
+        <script src="https://cdn.plot.ly/plotly-{get_plotlyjs_version()}.min.js"></script>
+        <div id="chart" style="height: {height}px;"></div>
+        <script>
+            const fig = {fig_json};
+            Plotly.newPlot('chart', fig.data, fig.layout, {{responsive: true}});
+        </script>
+        """,
+        height=height + 20
+    )
 
 # --- Sidebar for Page Navigation ---
 st.sidebar.title("Navigation")
@@ -73,7 +229,7 @@ if page == "1. Introduction":
     
     # We will use a try-except block in case the image is not found.
     try:
-        image = Image.open('bike_image.jpg')
+        image = load_image('bike_image.jpg')
         st.image(image, caption='A Citi Bike station in NYC.')
     except FileNotFoundError:
         pass # If the image isn't there, the app will just continue without it.
@@ -88,7 +244,6 @@ elif page == "2. Station Popularity Analysis":
 
     # --- Sidebar Filter ---
     st.sidebar.markdown("---") 
-    season_options = ['Winter', 'Spring', 'Summer', 'Fall'] # We define the list here
     season_filter = st.sidebar.multiselect(
         label='Select seasons to display:',
         options=season_options,
@@ -99,44 +254,10 @@ elif page == "2. Station Popularity Analysis":
     if not season_filter:
         st.warning("Please select at least one season in the sidebar.")
     else:
-        # Filter the dataframe based on the user's selection
-        df_filtered = df[df['season'].isin(season_filter)]
+        fig_stacked_bar, total_rides = build_stacked_bar(frozenset(season_filter))
         
         # --- KPI Metric ---
-        total_rides = len(df_filtered)
-        st.metric(label="Total Sampled Rides in Selected Seasons", value=numerize(float(total_rides)))
-        
-        # --- Dynamic Calculation for Stacked Bar Chart ---
-        top_20_station_names = df_filtered['start_station_name'].value_counts().nlargest(20).index
-        df_top_20 = df_filtered[df_filtered['start_station_name'].isin(top_20_station_names)]
-        df_stacked_data = df_top_20.groupby(['start_station_name', 'season']).size().reset_index(name='trip_count')
-
-        # --- Create the Stacked Bar Chart with Plotly ---
-        fig_stacked_bar = go.Figure()
-
-        # THE FIX: Use the correct variable 'season_options' in the loop
-        for season in season_options:
-            if season in season_filter: 
-                df_season = df_stacked_data[df_stacked_data['season'] == season]
-                fig_stacked_bar.add_trace(
-                    go.Bar(
-                        x=df_season['trip_count'],
-                        y=df_season['start_station_name'],
-                        name=season,
-                        orientation='h'
-                    )
-                )
-        
-        # Update the layout for a professional look
-        fig_stacked_bar.update_layout(
-            title=dict(text='Seasonal Trip Distribution for Top 20 Stations', x=0.5, xanchor='center'),
-            xaxis_title='Number of Trips (from sample)',
-            yaxis_title='Start Station Name',
-            yaxis=dict(categoryorder='total ascending'),
-            barmode='stack',
-            height=800,
-            legend_title_text='Season'
-        )
+        st.metric(label="Total Sampled Rides in Selected Seasons", value=format_count(total_rides))
         
         st.plotly_chart(fig_stacked_bar, use_container_width=True, theme="streamlit")
         
@@ -148,62 +269,49 @@ elif page == "3. Seasonal Ridership Trends":
     This seasonal pattern is a critical factor for managing fleet size and anticipating demand throughout the year.
     """)
 
-    # Create the Plotly dual-axis figure (this is the same code from your prototyping notebook)
-    fig_line = make_subplots(specs=[[{"secondary_y": True}]])
-    
-    # Add Bike Trips Trace
-    fig_line.add_trace(
-        go.Scatter(x=df_daily.index, y=df_daily['trip_count'], name='Daily Bike Trips', mode='lines', line=dict(color='deepskyblue')),
-        secondary_y=False,
-    )
-    
-    # Add Temperature Trace
-    fig_line.add_trace(
-        go.Scatter(x=df_daily.index, y=df_daily['avgTemp'], name='Avg. Temp (°C)', mode='lines', line=dict(color='tomato')),
-        secondary_y=True,
-    )
-    
-    # Update Layout
-    fig_line.update_layout(
-        title=dict(
-            text='Daily Bike Trips vs. Average Temperature in NYC (2022)',
-            x=0.5,
-            xanchor='center'
-        ),
-        template='plotly_dark', 
-        height=600,
-        legend=dict(x=0.02, y=0.98),
-        xaxis=dict(type='date', title='Date')
-    )
-    
-    # Update Y-Axes Titles
-    fig_line.update_yaxes(title_text='Daily Bike Trips', secondary_y=False)
-    fig_line.update_yaxes(title_text='Average Temperature (°C)', secondary_y=True)
-    
-    # Set the X-Axis Range
-    fig_line.update_xaxes(range=['2022-01-01', '2022-12-31'])
-    
     # Display the chart in the Streamlit app
-    st.plotly_chart(fig_line, use_container_width=True)
+    render_figure_json(build_daily_line_json(df_daily), height=600)
     
 elif page == "4. Geospatial Route Analysis":
     st.header("Geospatial Analysis of Popular Trip Routes")
     st.markdown("""
-    This map visualizes the top 1,000 most popular bike routes in 2022. The color and thickness of the arcs 
-    represent the number of trips, with bright red, thick lines indicating the busiest corridors. 
-    Use the filter on the map to narrow the view and discover the absolute busiest 'bike highways' of New York City.
+    This map visualizes the most popular A-to-B bike routes in 2022. The thickness of the arcs 
+    represents the number of trips, with the thickest lines indicating the busiest corridors among the routes shown. 
+    Round trips that start and end at the same station (common in leisure areas like Central Park) cannot be drawn as arcs and are not included. 
+    Use the slider in the sidebar to narrow the view and discover the absolute busiest 'bike highways' of New York City.
     """)
 
-    # Read the HTML map file that you created in Task 2.5
-    try:
-        with open('nyc_top_1000_bike_routes.html', 'r') as f:
-            html_data = f.read()
-
-        # Use st.components.v1.html to display the Kepler.gl map
-        st.components.v1.html(html_data, height=600)
+    # --- Sidebar Filter ---
+    st.sidebar.markdown("---")
+    route_count = st.sidebar.slider(
+        label='Number of top routes to display:',
+        min_value=10,
+        max_value=1000,
+        value=1000,
+        step=10
+    )
+    df_routes = load_top_routes(route_count)
+    # Scale the widths against the busiest arc on the map, so they span the full 1-10 range
+    df_routes['width'] = 1 + 9 * df_routes['trip_count'] / df_routes['trip_count'].max()
 
-    except FileNotFoundError:
-        st.error("Map file ('nyc_top_1000_bike_routes.html') not found. Please ensure it is in the same directory as the script.")
+    # Use deck.gl's ArcLayer to draw one arc per route on the GPU
+    route_layer = pdk.Layer(
+        'ArcLayer',
+        data=df_routes,
+        get_source_position=['start_lng', 'start_lat'],
+        get_target_position=['end_lng', 'end_lat'],
+        get_source_color=[255, 140, 0],
+        get_target_color=[255, 0, 0],
+        get_width='width',
+        pickable=True
+    )
+    st.pydeck_chart(
+        pdk.Deck(
+            layers=[route_layer],
+            initial_view_state=pdk.ViewState(latitude=40.73, longitude=-73.98, zoom=11.5, pitch=45),
+            tooltip={'text': '{start_station_name} to {end_station_name}: {trip_count} trips'}
+        )
+    )
         
 elif page == "5. Recommendations":
     st.title("Strategic Recommendations")
@@ -214,7 +322,7 @@ elif page == "5. Recommendations":
     # We place the image right after the introduction and before the main points.
     try:
         # Make sure the image file 'recommendation_image.jpg' is in your project folder
-        image = Image.open('bike_image_2.webp')
+        image = load_image('bike_image_2.webp')
         
         # THE FIX: Create three columns. The middle one will be twice as wide
         # as the outer ones, effectively making it 50% of the page width.